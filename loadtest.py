@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# Load test the feed server against a local SQLite stand-in for Supabase.
+#
+# Seeds a throwaway database, starts one or more waitress workers running server.app with the
+# firehose disabled, drives the XRPC and /api/users endpoints at a fixed concurrency and prints
+# throughput, latency percentiles and worker memory as JSON. Scenarios that write to the database
+# always run after the read-only ones, e.g.:
+#
+#   python loadtest.py --posts 100000 --concurrency 16 --duration 10 --output bench.json
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+from server.sqlite_client import create_client
+
+FEED_URI = 'at://did:plc:loadtest/app.bsky.feed.generator/loadtest'
+BASE_TIME = datetime(2024, 1, 1)
+SEED_CHUNK_SIZE = 5000
+
+READ_SCENARIOS = ('feed', 'feed_deep', 'describe', 'users_page', 'users_all')
+WRITE_SCENARIOS = ('users_add', 'users_bulk', 'users_remove')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test the feed server against local SQLite storage.')
+    parser.add_argument('--posts', type=int, default=10000, help='number of posts to seed')
+    parser.add_argument('--users', type=int, default=1000, help='number of active users to seed')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent client connections')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run each scenario')
+    parser.add_argument('--workers', type=int, default=1, help='server processes, each on its own port')
+    parser.add_argument('--threads', type=int, default=8, help='waitress threads per worker')
+    parser.add_argument('--port', type=int, default=8100, help='port of the first worker')
+    parser.add_argument('--limit', type=int, default=30, help='feed page size')
+    parser.add_argument('--deep-cursor', type=int, default=5000,
+                        help='how many posts back the deep-cursor scenario starts')
+    parser.add_argument('--bulk-size', type=int, default=100, help='DIDs per users_bulk request')
+    parser.add_argument('--remove-pool', type=int, default=100000,
+                        help='users seeded for users_remove to deactivate; it stops early once they run out')
+    parser.add_argument('--scenarios', default=','.join(READ_SCENARIOS + WRITE_SCENARIOS),
+                        help='comma-separated scenarios to run')
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+    # Seeded posts are spread across the seeded users, so there must be at least one
+    if args.users < 1:
+        parser.error('--users must be at least 1')
+    if args.bulk_size < 1:
+        parser.error('--bulk-size must be at least 1')
+    return args
+
+
+def seed(path, posts, users):
+    client = create_client(path)
+    dids = [f'did:plc:loadtest{i:08d}' for i in range(users)]
+    seed_users(path, dids)
+    for start in range(0, posts, SEED_CHUNK_SIZE):
+        client.table('posts').insert([
+            {
+                'uri': f'at://{dids[i % users]}/app.bsky.feed.post/{i:010d}',
+                'cid': f'bafyloadtest{i:010d}',
+                'reply_parent': None,
+                'reply_root': None,
+                'indexed_at': (BASE_TIME + timedelta(seconds=i)).isoformat()
+            }
+            for i in range(start, min(start + SEED_CHUNK_SIZE, posts))
+        ]).execute()
+
+
+def seed_users(path, dids):
+    client = create_client(path)
+    for start in range(0, len(dids), SEED_CHUNK_SIZE):
+        client.table('users').insert([
+            {'did': did, 'added_at': BASE_TIME.isoformat(), 'active': True}
+            for did in dids[start:start + SEED_CHUNK_SIZE]
+        ]).execute()
+
+
+def _removable_did(index):
+    return f'did:plc:loadtest-remove{index:010d}'
+
+
+def start_workers(args, workdir):
+    workers = []
+    for index in range(args.workers):
+        port = args.port + index
+        env = dict(
+            os.environ,
+            HOSTNAME='localhost',
+            FEED_URI=FEED_URI,
+            STORAGE_BACKEND='sqlite',
+            DATABASE_PATH=os.path.join(workdir, 'feed.db'),
+            SNAPSHOT_PATH=os.path.join(workdir, f'snapshot-{index}.bin'),
+            FIREHOSE_ENABLED='0',
+        )
+        log = open(os.path.join(workdir, f'worker-{index}.log'), 'wb')
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'waitress', f'--listen=127.0.0.1:{port}', f'--threads={args.threads}',
+             'server.app:app'],
+            env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        workers.append({'port': port, 'process': process, 'log': log})
+
+    for worker in workers:
+        _wait_until_healthy(worker)
+        # Load the in-memory serving state before anything is measured
+        _request(worker['port'], _feed_path(limit=1))
+    return workers
+
+
+def stop_workers(workers):
+    for worker in workers:
+        worker['process'].terminate()
+    for worker in workers:
+        worker['process'].wait(timeout=10)
+        worker['log'].close()
+
+
+def _wait_until_healthy(worker, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if worker['process'].poll() is not None:
+            raise RuntimeError(f"Worker on port {worker['port']} exited, see {worker['log'].name}")
+        try:
+            if _request(worker['port'], '/health') == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Worker on port {worker['port']} did not become healthy")
+
+
+def _request(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def _feed_path(limit, cursor=None):
+    path = f'/xrpc/app.bsky.feed.getFeedSkeleton?feed={quote(FEED_URI, safe="")}&limit={limit}'
+    if cursor:
+        path += f'&cursor={quote(cursor)}'
+    return path
+
+
+def build_scenarios(args):
+    """Map scenario names to their method, a path for the report and a request generator"""
+    # Seeded posts are one second apart, so the cursor for N posts back is a fixed timestamp
+    deep_cursor = (BASE_TIME + timedelta(seconds=max(args.posts - args.deep_cursor, 0))).isoformat()
+
+    def get(path):
+        return {'method': 'GET', 'path': path, 'next': lambda: (path, None)}
+
+    # itertools.count is safe to share between client threads; every write uses fresh DIDs
+    added = itertools.count()
+    bulk_batches = itertools.count()
+    removed = itertools.count()
+
+    def add_user():
+        return '/api/users', {'did': f'did:plc:loadtest-add{next(added):010d}'}
+
+    def add_users():
+        start = next(bulk_batches) * args.bulk_size
+        return '/api/users/bulk', {'dids': [f'did:plc:loadtest-bulk{i:010d}'
+                                            for i in range(start, start + args.bulk_size)]}
+
+    def remove_user():
+        index = next(removed)
+        if index >= args.remove_pool:
+            return None
+        return f'/api/users/{_removable_did(index)}', None
+
+    return {
+        'feed': get(_feed_path(args.limit)),
+        'feed_deep': get(_feed_path(args.limit, deep_cursor)),
+        'describe': get('/xrpc/app.bsky.feed.describeFeedGenerator'),
+        'users_page': get('/api/users?limit=100'),
+        'users_all': get('/api/users'),
+        'users_add': {'method': 'POST', 'path': '/api/users', 'next': add_user},
+        'users_bulk': {'method': 'POST', 'path': '/api/users/bulk', 'next': add_users},
+        'users_remove': {'method': 'DELETE', 'path': '/api/users/<did>', 'next': remove_user},
+    }
+
+
+def run_scenario(scenario, workers, concurrency, duration):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        port = workers[index % len(workers)]['port']
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local_latencies = []
+        local_errors = 0
+        while time.monotonic() < deadline:
+            request = scenario['next']()
+            if request is None:
+                break
+            path, body = request
+            headers = {}
+            if body is not None:
+                body = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            started = time.perf_counter()
+            try:
+                connection.request(scenario['method'], path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local_latencies.append(time.perf_counter() - started)
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        'method': scenario['method'],
+        'path': scenario['path'],
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            name: round(_percentile(latencies, q) * 1000, 3)
+            for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100))
+        },
+    }
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def worker_memory(worker):
+    """Current and peak resident set size of a worker in KiB, from /proc (Linux only)"""
+    memory = {'port': worker['port'], 'rss_kib': None, 'peak_rss_kib': None}
+    try:
+        with open(f"/proc/{worker['process'].pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    memory['rss_kib'] = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    memory['peak_rss_kib'] = int(line.split()[1])
+    except OSError:
+        pass
+    return memory
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    available = build_scenarios(args)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in available]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}. Choose from {', '.join(available)}")
+    # Writes change the data the reads measure, so run them last
+    scenarios.sort(key=lambda name: name in WRITE_SCENARIOS)
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'posts': args.posts,
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'workers': args.workers,
+            'threads': args.threads,
+            'limit': args.limit,
+            'deep_cursor': args.deep_cursor,
+            'bulk_size': args.bulk_size,
+            'remove_pool': args.remove_pool,
+        },
+        'scenarios': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='feed-loadtest-') as workdir:
+        print(f'Seeding {args.posts} posts and {args.users} users...', file=sys.stderr)
+        database_path = os.path.join(workdir, 'feed.db')
+        seed(database_path, args.posts, args.users)
+
+        workers = start_workers(args, workdir)
+        try:
+            results['workers_idle'] = [worker_memory(worker) for worker in workers]
+            for name in scenarios:
+                if name == 'users_remove':
+                    # Users without posts, so removing them measures the endpoint rather than the
+                    # size of someone's post history
+                    print(f'Seeding {args.remove_pool} users to remove...', file=sys.stderr)
+                    seed_users(database_path, [_removable_did(i) for i in range(args.remove_pool)])
+                print(f'Running {name}...', file=sys.stderr)
+                result = run_scenario(available[name], workers, args.concurrency, args.duration)
+                result['workers'] = [worker_memory(worker) for worker in workers]
+                results['scenarios'][name] = result
+        finally:
+            stop_workers(workers)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
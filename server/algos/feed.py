@@ -1,22 +1,30 @@
 from typing import Optional
 from server import config
 from server.database import Post
+from server.state import get_serving_state
 
 # Define the feed URI from config
 uri = config.FEED_URI
 
 def handler(cursor: Optional[str], limit: int) -> dict:
     """Handle feed generation"""
-    posts = Post.get_recent(limit=limit, cursor=cursor)
+    # Shallow pages come straight from memory, but only this process's firehose keeps the cached
+    # timeline current, so without it (or for deeper pages) read from Supabase
+    entries = None
+    if config.FIREHOSE_ENABLED:
+        entries = get_serving_state().get_recent(limit=limit, cursor=cursor)
+    if entries is None:
+        posts = Post.get_recent(limit=limit, cursor=cursor)
+        entries = [(post.uri, post.cid, post.indexed_at) for post in posts]
     
     feed = []
     cursor = None
     
-    for post in posts:
+    for post_uri, _, indexed_at in entries:
         feed.append({
-            'post': post.uri
+            'post': post_uri
         })
-        cursor = post.indexed_at.isoformat()
+        cursor = indexed_at.isoformat()
 
     return {
         'cursor': cursor,
@@ -1,11 +1,13 @@
+import json
 import sys
 import signal
 import threading
 
 from server import config
 from server import data_stream
+from server import state
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 
 from server.algos import algos
 from server.data_filter import operations_callback
@@ -13,16 +15,31 @@ from server.database import User
 
 app = Flask(__name__)
 
+# Page sizes getFeedSkeleton accepts, as in the app.bsky.feed.getFeedSkeleton lexicon
+MIN_FEED_LIMIT = 1
+MAX_FEED_LIMIT = 100
+
+# Largest page of users returned by GET /api/users
+MAX_USERS_PAGE_SIZE = 1000
+
 stream_stop_event = threading.Event()
-stream_thread = threading.Thread(
-    target=data_stream.run, args=(config.SERVICE_DID, operations_callback, stream_stop_event,)
-)
-stream_thread.start()
+if config.FIREHOSE_ENABLED:
+    stream_thread = threading.Thread(
+        target=data_stream.run, args=(config.SERVICE_DID, operations_callback, stream_stop_event,)
+    )
+    stream_thread.start()
+
+    # Only the process consuming the firehose keeps the serving state current, so it alone
+    # snapshots it
+    snapshot_thread = threading.Thread(target=state.run_snapshots, args=(stream_stop_event,), daemon=True)
+    snapshot_thread.start()
 
 
 def sigint_handler(*_):
     print('Stopping data stream...')
     stream_stop_event.set()
+    if config.FIREHOSE_ENABLED:
+        state.save_snapshot()
     sys.exit(0)
 
 
@@ -86,9 +103,12 @@ def get_feed_skeleton():
         return 'Unauthorized', 401
     """
 
+    limit = request.args.get('limit', default=20, type=int)
+    if not MIN_FEED_LIMIT <= limit <= MAX_FEED_LIMIT:
+        return f'limit must be between {MIN_FEED_LIMIT} and {MAX_FEED_LIMIT}', 400
+
     try:
         cursor = request.args.get('cursor', default=None, type=str)
-        limit = request.args.get('limit', default=20, type=int)
         body = algo(cursor, limit)
     except ValueError:
         return 'Malformed cursor', 400
@@ -111,12 +131,48 @@ def add_user():
         
         did = data['did']
         User.add(did)
+        state.get_serving_state().add_user(did)
         return jsonify({'message': f'Successfully added user: {did}'}), 200
     except Exception as e:
         app.logger.error(f"Error adding user: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/users/bulk', methods=['POST'])
+def add_users():
+    """Add many users to the feed at once"""
+    try:
+        # silent: a missing or non-JSON body is a client error, not a 415/500
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('dids'), list):
+            return jsonify({'error': 'Missing dids list in request'}), 400
+        
+        dids = data['dids']
+        if not all(isinstance(did, str) and did for did in dids):
+            return jsonify({'error': 'dids must be non-empty strings'}), 400
+        
+        # Drop duplicates, keeping the order they were given in
+        dids = list(dict.fromkeys(dids))
+    except Exception as e:
+        app.logger.error(f"Error adding users: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+    # Chunks commit one at a time, so start ingesting each one as soon as it is stored
+    added = 0
+    try:
+        for chunk in User.add_many(dids):
+            state.get_serving_state().add_users(chunk)
+            added += len(chunk)
+        return jsonify({'message': f'Successfully added {added} users', 'count': added}), 200
+    except Exception as e:
+        app.logger.error(f"Error adding users after {added} of {len(dids)}: {str(e)}")
+        return jsonify({
+            'error': str(e),
+            'message': f'Added {added} of {len(dids)} users',
+            'count': added
+        }), 500
+
+
 @app.route('/api/users/<did>', methods=['DELETE'])
 def remove_user(did):
     """Remove a user from the feed"""
@@ -124,7 +180,12 @@ def remove_user(did):
         if not User.is_active(did):
             return jsonify({'message': 'User not found or already inactive'}), 404
         
-        User.remove(did)
+        try:
+            User.remove(did)
+        finally:
+            # Deactivation is written before their posts are removed, so stop ingesting and
+            # serving them even if the cleanup failed
+            state.get_serving_state().remove_user(did)
         return jsonify({'message': f'Successfully removed user: {did}'}), 200
     except Exception as e:
         app.logger.error(f"Error removing user: {str(e)}")
@@ -133,10 +194,49 @@ def remove_user(did):
 
 @app.route('/api/users', methods=['GET'])
 def list_users():
-    """List all active users"""
+    """List active users, one page with a limit or streamed in full without one"""
+    cursor = request.args.get('cursor', default=None, type=str)
+    limit = request.args.get('limit', default=None, type=str)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= MAX_USERS_PAGE_SIZE:
+            return jsonify({'error': f'limit must be between 1 and {MAX_USERS_PAGE_SIZE}'}), 400
+
     try:
-        users = User.get_all_active()
-        return jsonify({'users': users}), 200
+        if limit is not None:
+            users, next_cursor, count = User.get_active_page(limit=limit, cursor=cursor, with_count=True)
+            return jsonify({'users': users, 'count': count, 'cursor': next_cursor}), 200
+
+        # Fetch the first page up front so errors still get a proper status code
+        users, next_cursor, count = User.get_active_page(limit=MAX_USERS_PAGE_SIZE, cursor=cursor,
+                                                         with_count=True)
     except Exception as e:
         app.logger.error(f"Error listing users: {str(e)}")
         return jsonify({'error': str(e)}), 500
+
+    def generate(users, next_cursor):
+        first = True
+        error = None
+        yield '{"users": ['
+        while True:
+            for did in users:
+                yield ('' if first else ', ') + json.dumps(did)
+                first = False
+            if next_cursor is None:
+                break
+            try:
+                users, next_cursor, _ = User.get_active_page(limit=MAX_USERS_PAGE_SIZE, cursor=next_cursor)
+            except Exception as e:
+                # Headers are already sent, so report the error in the body and keep it well-formed
+                app.logger.error(f"Error streaming users: {str(e)}")
+                error = str(e)
+                break
+        tail = {'count': count}
+        if error:
+            tail['error'] = error
+        yield '], ' + json.dumps(tail)[1:]
+
+    return Response(stream_with_context(generate(users, next_cursor)), mimetype='application/json')
@@ -15,6 +15,12 @@ SERVICE_DID = os.environ.get('SERVICE_DID')
 HOSTNAME = os.environ.get('HOSTNAME')
 FLASK_RUN_FROM_CLI = os.environ.get('FLASK_RUN_FROM_CLI')
 
+# Storage backend: 'supabase', or 'sqlite' for a local stand-in at DATABASE_PATH
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'supabase')
+
+# Set to 0 to serve without consuming the firehose, e.g. when load testing
+FIREHOSE_ENABLED = os.environ.get('FIREHOSE_ENABLED', '1') != '0'
+
 # Supabase configuration
 SUPABASE_URL = os.environ.get('SUPABASE_URL')
 SUPABASE_ANON_KEY = os.environ.get('SUPABASE_ANON_KEY')
@@ -28,7 +34,10 @@ if HOSTNAME is None:
 if SERVICE_DID is None:
     SERVICE_DID = f'did:web:{HOSTNAME}'
 
-if SUPABASE_URL is None or SUPABASE_ANON_KEY is None:
+if STORAGE_BACKEND not in ('supabase', 'sqlite'):
+    raise RuntimeError(f'Unknown STORAGE_BACKEND "{STORAGE_BACKEND}". Use "supabase" or "sqlite"')
+
+if STORAGE_BACKEND == 'supabase' and (SUPABASE_URL is None or SUPABASE_ANON_KEY is None):
     raise RuntimeError('Supabase configuration is missing. Please set SUPABASE_URL and SUPABASE_ANON_KEY')
 
 FEED_URI = os.environ.get('FEED_URI')
@@ -37,4 +46,8 @@ if FEED_URI is None:
                        'Set this URI to "FEED_URI" environment variable.')
 
 # Update the database path to use the data directory
-DATABASE_PATH = 'data/feed.db'  # This will resolve to /app/data/feed.db in the container
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'data/feed.db')  # This will resolve to /app/data/feed.db in the container
+
+# Warm-start snapshot of the in-process serving state
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH', 'data/snapshot.bin')
+SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', '60'))  # seconds
@@ -1,10 +1,11 @@
 from collections import defaultdict
 from datetime import datetime
 
-from atproto import models
+from atproto import AtUri, models
 
 from server.logger import logger
-from server.database import Post, User
+from server.database import Post
+from server.state import get_serving_state
 
 
 def operations_callback(ops: defaultdict) -> None:
@@ -14,6 +15,7 @@ def operations_callback(ops: defaultdict) -> None:
 
     # for example, let's create our custom feed that will contain all posts that contains alf related text
 
+    state = get_serving_state()
     posts_to_create = []
     
     # Log the total number of posts received only in debug mode
@@ -24,7 +26,11 @@ def operations_callback(ops: defaultdict) -> None:
         author = created_post['author']
         
         # Only process posts from active users
-        if not User.is_active(author):
+        if not state.is_active(author):
+            continue
+
+        # Skip posts we just stored, e.g. when the firehose replays from the last stored cursor
+        if state.is_stored(created_post['uri']):
             continue
             
         record = created_post['record']
@@ -51,15 +57,19 @@ def operations_callback(ops: defaultdict) -> None:
 
     posts_to_delete = ops[models.ids.AppBskyFeedPost]['deleted']
     if posts_to_delete:
-        post_uris_to_delete = [post['uri'] for post in posts_to_delete]
-        logger.info(f"Deleting {len(post_uris_to_delete)} posts")
-        Post.delete_many(post_uris_to_delete)
+        # Only posts from active users are stored, so other deletes need no round-trip
+        post_uris_to_delete = [post['uri'] for post in posts_to_delete
+                               if state.is_active(AtUri.from_str(post['uri']).host)]
+        if post_uris_to_delete:
+            logger.info(f"Deleting {len(post_uris_to_delete)} posts")
+            Post.delete_many(post_uris_to_delete)
+            state.remove_posts(post_uris_to_delete)
 
     if posts_to_create:
         logger.info(f"Storing {len(posts_to_create)} new posts")
         try:
             for post_dict in posts_to_create:
-                Post.create(**post_dict)
+                state.add_post(Post.create(**post_dict))
         except Exception as e:
             logger.error(f'Error creating posts: {str(e)}')
             raise e
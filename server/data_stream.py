@@ -6,6 +6,7 @@ from atproto.exceptions import FirehoseError
 
 from server.database import SubscriptionState
 from server.logger import logger
+from server.state import get_serving_state
 
 _INTERESTED_RECORDS = {
     models.AppBskyFeedLike: models.ids.AppBskyFeedLike,
@@ -62,6 +63,13 @@ def run(name, operations_callback, stream_stop_event=None):
 
 def _run(name, operations_callback, stream_stop_event=None):
     state = SubscriptionState.get_or_create(name)
+    serving_state = get_serving_state()
+
+    # A freshly loaded snapshot does not know about users and posts added since it was written,
+    # so hold the firehose until it has caught up rather than drop their creates and deletes
+    while not serving_state.reconciled.wait(1):
+        if stream_stop_event and stream_stop_event.is_set():
+            return
 
     params = None
     if state:
@@ -84,9 +92,9 @@ def _run(name, operations_callback, stream_stop_event=None):
             if state:
                 state.update_cursor(commit.seq)
 
-        if not commit.blocks:
-            return
+        if commit.blocks:
+            operations_callback(_get_ops_by_type(commit))
 
-        operations_callback(_get_ops_by_type(commit))
+        serving_state.mark_seq(commit.seq)
 
     client.start(on_message_handler)
\ No newline at end of file
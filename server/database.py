@@ -1,12 +1,33 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 from supabase import create_client, Client
-from server.config import SUPABASE_URL, SUPABASE_ANON_KEY
+from server.config import DATABASE_PATH, STORAGE_BACKEND, SUPABASE_URL, SUPABASE_ANON_KEY
 from server.logger import logger
 import re
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+# Initialize Supabase client, or the local SQLite stand-in with the same query interface
+if STORAGE_BACKEND == 'sqlite':
+    from server import sqlite_client
+    supabase = sqlite_client.create_client(DATABASE_PATH)
+else:
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+
+# Supabase caps a single select at 1000 rows
+_PAGE_SIZE = 1000
+
+# Rows per upsert statement when enrolling users in bulk
+_UPSERT_CHUNK_SIZE = 500
+
+
+def _parse_datetime(dt_str: str) -> datetime:
+    # Remove microseconds if present (everything between . and +/Z)
+    dt_str = re.sub(r'\.\d+(?=[-+Z])', '', dt_str)
+    # Remove timezone offset if present
+    dt_str = re.sub(r'[-+]\d{2}:?\d{2}$', '', dt_str)
+    # Remove Z if present
+    dt_str = dt_str.replace('Z', '')
+    return datetime.fromisoformat(dt_str)
+
 
 class Post:
     def __init__(self, uri: str, cid: str, reply_parent: Optional[str] = None, 
@@ -31,7 +52,9 @@ class Post:
         try:
             logger.info(f"Attempting to insert post: {data['uri']}")
             logger.debug(f"Post data: {data}")
-            result = supabase.table('posts').insert(data).execute()
+            # The firehose replays from the last stored cursor after a restart, so the post
+            # may already be stored
+            result = supabase.table('posts').upsert(data, on_conflict='uri', ignore_duplicates=True).execute()
             logger.debug(f"Supabase response: {result}")
             logger.info(f"Successfully inserted post: {data['uri']}")
             return post
@@ -61,29 +84,21 @@ class Post:
             result = query.limit(limit).execute()
             logger.info(f"Found {len(result.data)} posts")
             
-            def parse_datetime(dt_str: str) -> datetime:
-                # Remove microseconds if present (everything between . and +/Z)
-                dt_str = re.sub(r'\.\d+(?=[-+Z])', '', dt_str)
-                # Remove timezone offset if present
-                dt_str = re.sub(r'[-+]\d{2}:?\d{2}$', '', dt_str)
-                # Remove Z if present
-                dt_str = dt_str.replace('Z', '')
-                return datetime.fromisoformat(dt_str)
-            
-            return [
-                Post(
-                    uri=row['uri'],
-                    cid=row['cid'],
-                    reply_parent=row['reply_parent'],
-                    reply_root=row['reply_root'],
-                    indexed_at=parse_datetime(row['indexed_at'])
-                )
-                for row in result.data
-            ]
+            return [Post._from_row(row) for row in result.data]
         except Exception as e:
             logger.error(f"Error getting recent posts: {str(e)}")
             raise
 
+    @staticmethod
+    def _from_row(row: dict) -> 'Post':
+        return Post(
+            uri=row['uri'],
+            cid=row['cid'],
+            reply_parent=row['reply_parent'],
+            reply_root=row['reply_root'],
+            indexed_at=_parse_datetime(row['indexed_at'])
+        )
+
 class SubscriptionState:
     def __init__(self, service: str, cursor: int):
         self.service = service
@@ -140,12 +155,8 @@ class User:
                 'active': True
             }
             
-            # Try to update existing user first
-            result = supabase.table('users').update(data).eq('did', did).execute()
-            
-            # If no user was updated, insert new one
-            if not result.data:
-                result = supabase.table('users').insert(data).execute()
+            # Insert or reactivate in a single statement
+            result = supabase.table('users').upsert(data, on_conflict='did').execute()
             
             logger.info(f"Successfully added user: {did}")
             return User(did=did)
@@ -153,6 +164,25 @@ class User:
             logger.error(f"Error adding user {did}: {str(e)}")
             raise
 
+    @staticmethod
+    def add_many(dids: List[str]) -> Iterator[List[str]]:
+        """Add or reactivate users one statement per chunk, yielding each committed chunk"""
+        try:
+            logger.info(f"Adding {len(dids)} users to feed")
+            added_at = datetime.utcnow().isoformat()
+            for start in range(0, len(dids), _UPSERT_CHUNK_SIZE):
+                chunk = dids[start:start + _UPSERT_CHUNK_SIZE]
+                supabase.table('users').upsert(
+                    [{'did': did, 'added_at': added_at, 'active': True} for did in chunk],
+                    on_conflict='did'
+                ).execute()
+                logger.debug(f"Upserted users {start} to {start + len(chunk)}")
+                yield chunk
+            logger.info(f"Successfully added {len(dids)} users")
+        except Exception as e:
+            logger.error(f"Error adding users in bulk: {str(e)}")
+            raise
+
     @staticmethod
     def remove(did: str) -> None:
         """Deactivate a user and remove their posts"""
@@ -164,11 +194,8 @@ class User:
                 'active': False
             }).eq('did', did).execute()
             
-            # Remove their posts
-            posts = supabase.table('posts').select('uri').eq('author', did).execute()
-            if posts.data:
-                uris = [post['uri'] for post in posts.data]
-                Post.delete_many(uris)
+            # Remove their posts; posts have no author column, but their URIs start with it
+            supabase.table('posts').delete().like('uri', f'at://{did}/%').execute()
             
             logger.info(f"Successfully removed user and their posts: {did}")
         except Exception as e:
@@ -190,8 +217,43 @@ class User:
         """Get all active users"""
         try:
             logger.debug("Getting all active users")
-            result = supabase.table('users').select('did').eq('active', True).execute()
-            return [row['did'] for row in result.data]
+            dids = []
+            cursor = None
+            while True:
+                page, cursor, _ = User.get_active_page(limit=_PAGE_SIZE, cursor=cursor)
+                dids.extend(page)
+                if cursor is None:
+                    return dids
         except Exception as e:
             logger.error(f"Error getting active users: {str(e)}")
             raise
+
+    @staticmethod
+    def get_active_page(limit: int = _PAGE_SIZE, cursor: Optional[str] = None,
+                        with_count: bool = False) -> Tuple[List[str], Optional[str], Optional[int]]:
+        """Get active users after cursor by DID, the next cursor and optionally the total count"""
+        try:
+            logger.debug(f"Getting active users (limit={limit}, cursor={cursor})")
+            query = supabase.table('users').select('did', count='exact' if with_count and not cursor else None) \
+                .eq('active', True) \
+                .order('did')
+            
+            if cursor:
+                query = query.gt('did', cursor)
+            
+            result = query.limit(limit).execute()
+            dids = [row['did'] for row in result.data]
+            next_cursor = dids[-1] if len(dids) == limit else None
+            
+            count = None
+            if with_count:
+                # The cursor filter narrows the page query's count, so count all users separately
+                count = result.count if not cursor else supabase.table('users') \
+                    .select('did', count='exact') \
+                    .eq('active', True) \
+                    .limit(1) \
+                    .execute().count
+            return dids, next_cursor, count
+        except Exception as e:
+            logger.error(f"Error getting active users page: {str(e)}")
+            raise
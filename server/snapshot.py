@@ -0,0 +1,159 @@
+import os
+import struct
+import tempfile
+import zlib
+from datetime import datetime, timezone
+from typing import List, Optional, Set, Tuple
+
+from server.logger import logger
+
+# File layout (all integers little-endian):
+#   header:   magic (4s) | version (B) | seq (q, -1 if unknown) | written_at (d, unix time)
+#   users:    count (I) | count * string
+#   timeline: count (I) | count * (uri string | cid string | indexed_at (q, unix seconds))
+#   uris:     count (I) | count * string, oldest first
+#   trailer:  crc32 of everything above (I)
+# where string is a length-prefixed utf-8 blob: length (I) | bytes.
+_MAGIC = b'BFGS'
+_VERSION = 1
+
+_HEADER = struct.Struct('<4sBqd')
+_COUNT = struct.Struct('<I')
+_TIMESTAMP = struct.Struct('<q')
+
+# (uri, cid, indexed_at) with indexed_at as naive UTC, matching Post.indexed_at
+TimelineEntry = Tuple[str, str, datetime]
+
+
+class SnapshotError(Exception):
+    ...
+
+
+class Snapshot:
+    def __init__(self, seq: Optional[int], active_users: Set[str], timeline: List[TimelineEntry],
+                 stored_uris: List[str], written_at: Optional[datetime] = None):
+        self.seq = seq
+        self.active_users = active_users
+        self.timeline = timeline
+        self.stored_uris = stored_uris
+        self.written_at = written_at or datetime.utcnow()
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(_MAGIC, _VERSION, -1 if self.seq is None else self.seq,
+                              _to_unix(self.written_at))]
+
+        parts.append(_COUNT.pack(len(self.active_users)))
+        parts.extend(_pack_str(did) for did in self.active_users)
+
+        parts.append(_COUNT.pack(len(self.timeline)))
+        for uri, cid, indexed_at in self.timeline:
+            parts.append(_pack_str(uri))
+            parts.append(_pack_str(cid))
+            parts.append(_TIMESTAMP.pack(int(_to_unix(indexed_at))))
+
+        parts.append(_COUNT.pack(len(self.stored_uris)))
+        parts.extend(_pack_str(uri) for uri in self.stored_uris)
+
+        body = b''.join(parts)
+        return body + _COUNT.pack(zlib.crc32(body))
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'Snapshot':
+        if len(data) < _HEADER.size + _COUNT.size:
+            raise SnapshotError('Snapshot is truncated')
+
+        body, trailer = data[:-_COUNT.size], data[-_COUNT.size:]
+        if zlib.crc32(body) != _COUNT.unpack(trailer)[0]:
+            raise SnapshotError('Snapshot checksum mismatch')
+
+        view = memoryview(body)
+        magic, version, seq, written_at = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise SnapshotError(f'Unsupported snapshot format: {magic!r} v{version}')
+        offset = _HEADER.size
+
+        count, offset = _unpack_count(view, offset)
+        active_users = set()
+        for _ in range(count):
+            did, offset = _unpack_str(view, offset)
+            active_users.add(did)
+
+        count, offset = _unpack_count(view, offset)
+        timeline = []
+        for _ in range(count):
+            uri, offset = _unpack_str(view, offset)
+            cid, offset = _unpack_str(view, offset)
+            (indexed_at,) = _TIMESTAMP.unpack_from(view, offset)
+            offset += _TIMESTAMP.size
+            timeline.append((uri, cid, _from_unix(indexed_at)))
+
+        count, offset = _unpack_count(view, offset)
+        stored_uris = []
+        for _ in range(count):
+            uri, offset = _unpack_str(view, offset)
+            stored_uris.append(uri)
+
+        return Snapshot(
+            seq=None if seq < 0 else seq,
+            active_users=active_users,
+            timeline=timeline,
+            stored_uris=stored_uris,
+            written_at=_from_unix(written_at)
+        )
+
+    def save(self, path: str) -> None:
+        """Atomically replace the snapshot at path"""
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+
+        # A unique temporary file, so processes sharing the data volume never interleave writes
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'{os.path.basename(path)}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.to_bytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.debug(f"Wrote snapshot to {path} (seq={self.seq}, users={len(self.active_users)}, "
+                     f"timeline={len(self.timeline)}, uris={len(self.stored_uris)})")
+
+    @staticmethod
+    def load(path: str) -> Optional['Snapshot']:
+        """Read the snapshot at path, or None if it is missing or unreadable"""
+        try:
+            with open(path, 'rb') as f:
+                return Snapshot.from_bytes(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, struct.error, UnicodeDecodeError, SnapshotError) as e:
+            logger.warning(f"Ignoring unreadable snapshot {path}: {str(e)}")
+            return None
+
+
+def _pack_str(value: str) -> bytes:
+    encoded = value.encode('utf-8')
+    return _COUNT.pack(len(encoded)) + encoded
+
+
+def _unpack_count(view: memoryview, offset: int) -> Tuple[int, int]:
+    (count,) = _COUNT.unpack_from(view, offset)
+    return count, offset + _COUNT.size
+
+
+def _unpack_str(view: memoryview, offset: int) -> Tuple[str, int]:
+    length, offset = _unpack_count(view, offset)
+    end = offset + length
+    if end > len(view):
+        raise SnapshotError('Snapshot is truncated')
+    return bytes(view[offset:end]).decode('utf-8'), end
+
+
+def _to_unix(dt: datetime) -> float:
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _from_unix(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(tzinfo=None)
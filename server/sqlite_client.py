@@ -0,0 +1,194 @@
+# Local SQLite stand-in for the Supabase client: implements the subset of the PostgREST query
+# builder used by server.database, so the server can run without a Supabase project.
+import sqlite3
+import threading
+from typing import Any, List, Optional, Union
+
+from server.logger import logger
+
+_SCHEMA = """
+create table if not exists posts (
+    uri text primary key,
+    cid text not null,
+    reply_parent text,
+    reply_root text,
+    indexed_at text not null default (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+create index if not exists posts_indexed_at_idx on posts(indexed_at desc);
+
+create table if not exists subscription_states (
+    service text primary key,
+    cursor integer not null
+);
+
+create table if not exists users (
+    did text primary key,
+    added_at text not null default (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    active boolean not null default 1
+);
+create index if not exists users_added_at_idx on users(added_at desc);
+create index if not exists users_active_did_idx on users(did) where active;
+"""
+
+
+class APIResponse:
+    def __init__(self, data: List[dict], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class SQLiteClient:
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute('pragma journal_mode=wal')
+            self._connection.executescript(_SCHEMA)
+
+    def table(self, name: str) -> 'QueryBuilder':
+        return QueryBuilder(self, name)
+
+    def execute(self, sql: str, params: List[Any], many: bool = False) -> List[dict]:
+        logger.debug(f"SQLite: {sql} {params}")
+        with self._lock, self._connection:
+            if many:
+                cursor = self._connection.executemany(sql, params)
+            else:
+                cursor = self._connection.execute(sql, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+
+class QueryBuilder:
+    def __init__(self, client: SQLiteClient, table: str):
+        self._client = client
+        self._table = table
+        self._action = None
+        self._columns = '*'
+        self._count = None
+        self._values = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+        self._filters = []
+        self._params = []
+        self._order = []
+        self._limit = None
+        self._offset = None
+
+    def select(self, columns: str = '*', count: Optional[str] = None) -> 'QueryBuilder':
+        self._action = 'select'
+        self._columns = columns
+        self._count = count
+        return self
+
+    def insert(self, values: Union[dict, List[dict]]) -> 'QueryBuilder':
+        self._action = 'insert'
+        self._values = values if isinstance(values, list) else [values]
+        return self
+
+    def upsert(self, values: Union[dict, List[dict]], on_conflict: str = '',
+               ignore_duplicates: bool = False) -> 'QueryBuilder':
+        self.insert(values)
+        self._on_conflict = on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: dict) -> 'QueryBuilder':
+        self._action = 'update'
+        self._values = values
+        return self
+
+    def delete(self) -> 'QueryBuilder':
+        self._action = 'delete'
+        return self
+
+    def eq(self, column: str, value: Any) -> 'QueryBuilder':
+        return self._filter(column, '=', value)
+
+    def gt(self, column: str, value: Any) -> 'QueryBuilder':
+        return self._filter(column, '>', value)
+
+    def gte(self, column: str, value: Any) -> 'QueryBuilder':
+        return self._filter(column, '>=', value)
+
+    def lt(self, column: str, value: Any) -> 'QueryBuilder':
+        return self._filter(column, '<', value)
+
+    def like(self, column: str, pattern: str) -> 'QueryBuilder':
+        return self._filter(column, 'like', pattern)
+
+    def in_(self, column: str, values: List[Any]) -> 'QueryBuilder':
+        self._filters.append(f"{column} in ({', '.join('?' for _ in values)})")
+        self._params.extend(values)
+        return self
+
+    def order(self, column: str, desc: bool = False) -> 'QueryBuilder':
+        self._order.append(f"{column} {'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, size: int) -> 'QueryBuilder':
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int) -> 'QueryBuilder':
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def execute(self) -> APIResponse:
+        if self._action == 'select':
+            return self._execute_select()
+        if self._action == 'insert':
+            return self._execute_insert()
+        if self._action == 'update':
+            assignments = ', '.join(f'{column} = ?' for column in self._values)
+            sql = f'update {self._table} set {assignments}{self._where()} returning *'
+            return APIResponse(self._client.execute(sql, list(self._values.values()) + self._params))
+        if self._action == 'delete':
+            sql = f'delete from {self._table}{self._where()} returning *'
+            return APIResponse(self._client.execute(sql, self._params))
+        raise ValueError(f'No action set on query for table {self._table}')
+
+    def _execute_select(self) -> APIResponse:
+        sql = f'select {self._columns} from {self._table}{self._where()}'
+        if self._order:
+            sql += f" order by {', '.join(self._order)}"
+        if self._limit is not None:
+            sql += f' limit {int(self._limit)}'
+            if self._offset is not None:
+                sql += f' offset {int(self._offset)}'
+        data = self._client.execute(sql, self._params)
+
+        count = None
+        if self._count:
+            rows = self._client.execute(f'select count(*) as count from {self._table}{self._where()}', self._params)
+            count = rows[0]['count']
+        return APIResponse(data, count)
+
+    def _execute_insert(self) -> APIResponse:
+        if not self._values:
+            return APIResponse([])
+        columns = list(self._values[0])
+        sql = f"insert into {self._table} ({', '.join(columns)}) values ({', '.join('?' for _ in columns)})"
+        if self._on_conflict and self._ignore_duplicates:
+            sql += f' on conflict({self._on_conflict}) do nothing'
+        elif self._on_conflict:
+            updates = ', '.join(f'{column} = excluded.{column}' for column in columns
+                                if column != self._on_conflict)
+            sql += f' on conflict({self._on_conflict}) do update set {updates}'
+        self._client.execute(sql, [[row[column] for column in columns] for row in self._values], many=True)
+        return APIResponse(self._values)
+
+    def _filter(self, column: str, operator: str, value: Any) -> 'QueryBuilder':
+        self._filters.append(f'{column} {operator} ?')
+        self._params.append(value)
+        return self
+
+    def _where(self) -> str:
+        if not self._filters:
+            return ''
+        return f" where {' and '.join(self._filters)}"
+
+
+def create_client(path: str) -> SQLiteClient:
+    return SQLiteClient(path)
@@ -0,0 +1,258 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from server import config
+from server.database import Post, User
+from server.logger import logger
+from server.snapshot import Snapshot, TimelineEntry
+
+# Number of most recent posts kept in memory to serve feed pages without a round-trip
+TIMELINE_SIZE = 1000
+
+# Number of most recently stored post URIs remembered, far more than the firehose replays from
+# the last stored cursor (at most 1000 commits) can create again
+STORED_URIS_SIZE = 10000
+
+# Longest wait, in seconds, between attempts to reconcile a loaded snapshot
+RECONCILE_MAX_DELAY = 60
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class ServingState:
+    """Bounded in-memory copy of the active users, recent posts and recently stored URIs"""
+
+    def __init__(self, snapshot: Snapshot):
+        self._lock = threading.Lock()
+        self.seq = snapshot.seq
+        self._active_users = set(snapshot.active_users)
+        # Oldest first, used as a bounded insertion-ordered set
+        self._stored_uris = OrderedDict.fromkeys(snapshot.stored_uris[-STORED_URIS_SIZE:])
+        # Newest first, same order as Post.get_recent
+        self._timeline = sorted(snapshot.timeline, key=lambda entry: entry[2], reverse=True)[:TIMELINE_SIZE]
+        # Negated timestamps, ascending, for bisecting the timeline by cursor
+        self._timeline_keys = [_key(entry[2]) for entry in self._timeline]
+        # Set once the state has caught up with Supabase; until then it may miss recent writes
+        self.reconciled = threading.Event()
+        # (did, active) changes made while a reconcile is fetching users, replayed on top of them
+        self._user_changes: Optional[List[Tuple[str, bool]]] = None
+
+    @staticmethod
+    def rebuild() -> 'ServingState':
+        """Build the state from the users table and the most recent posts"""
+        logger.info("Rebuilding serving state from Supabase")
+        timeline = [_entry(post) for post in Post.get_recent(limit=TIMELINE_SIZE)]
+        state = ServingState(Snapshot(
+            seq=None,
+            active_users=set(User.get_all_active()),
+            timeline=timeline,
+            stored_uris=[entry[0] for entry in reversed(timeline)]
+        ))
+        state.reconciled.set()
+        return state
+
+    def to_snapshot(self) -> Snapshot:
+        with self._lock:
+            return Snapshot(
+                seq=self.seq,
+                active_users=set(self._active_users),
+                timeline=list(self._timeline),
+                stored_uris=list(self._stored_uris)
+            )
+
+    def reconcile(self) -> None:
+        """Catch up with writes, deletes and deactivations since the snapshot was taken"""
+        with self._lock:
+            self._user_changes = []
+        try:
+            timeline = [_entry(post) for post in Post.get_recent(limit=TIMELINE_SIZE)]
+            active_users = set(User.get_all_active())
+            with self._lock:
+                for did, active in self._user_changes:
+                    if active:
+                        active_users.add(did)
+                    else:
+                        active_users.discard(did)
+                self._active_users = active_users
+                self._replace_timeline(timeline)
+        finally:
+            with self._lock:
+                self._user_changes = None
+        self.reconciled.set()
+        logger.info(f"Reconciled serving state: {len(self._timeline)} recent posts, "
+                    f"{len(active_users)} active users")
+
+    def is_active(self, did: str) -> bool:
+        return did in self._active_users
+
+    def add_user(self, did: str) -> None:
+        self.add_users([did])
+
+    def add_users(self, dids: Iterable[str]) -> None:
+        dids = set(dids)
+        # Swap in a new set so the firehose sees either none or all of the new users
+        with self._lock:
+            self._active_users = self._active_users | dids
+            if self._user_changes is not None:
+                self._user_changes.extend((did, True) for did in dids)
+
+    def remove_user(self, did: str) -> None:
+        """Stop ingesting a user and drop their posts from memory"""
+        prefix = f'at://{did}/'
+        with self._lock:
+            self._active_users.discard(did)
+            if self._user_changes is not None:
+                self._user_changes.append((did, False))
+            self._stored_uris = OrderedDict.fromkeys(uri for uri in self._stored_uris
+                                                     if not uri.startswith(prefix))
+            self._drop_from_timeline(lambda uri: uri.startswith(prefix))
+
+    def is_stored(self, uri: str) -> bool:
+        return uri in self._stored_uris
+
+    def add_post(self, post: Post) -> None:
+        with self._lock:
+            self._add_post(_entry(post))
+
+    def remove_posts(self, uris: Iterable[str]) -> None:
+        uris = set(uris)
+        with self._lock:
+            for uri in uris:
+                self._stored_uris.pop(uri, None)
+            self._drop_from_timeline(lambda uri: uri in uris)
+
+    def mark_seq(self, seq: int) -> None:
+        self.seq = seq
+
+    def get_recent(self, limit: int, cursor: Optional[str] = None) -> Optional[List[TimelineEntry]]:
+        """Serve a feed page from memory, or None if it reaches past the cached timeline"""
+        if limit < 1:
+            return None
+        with self._lock:
+            start = 0
+            if cursor:
+                # Posts strictly older than the cursor, as in Post.get_recent
+                start = bisect.bisect_right(self._timeline_keys, _key(datetime.fromisoformat(cursor)))
+            page = self._timeline[start:start + limit]
+        if len(page) < limit:
+            return None
+        return page
+
+    def _replace_timeline(self, timeline: List[TimelineEntry]) -> None:
+        # Cached posts inside the window the fresh timeline covers but missing from it were deleted
+        uris = {entry[0] for entry in timeline}
+        complete = len(timeline) < TIMELINE_SIZE
+        deleted = {entry[0] for entry in self._timeline
+                   if entry[0] not in uris and (complete or entry[2] > timeline[-1][2])}
+
+        timeline = [entry for entry in timeline if _author(entry[0]) in self._active_users]
+        self._timeline = timeline
+        self._timeline_keys = [_key(entry[2]) for entry in timeline]
+
+        stored_uris = OrderedDict.fromkeys(uri for uri in self._stored_uris
+                                           if uri not in deleted and _author(uri) in self._active_users)
+        for entry in reversed(timeline):
+            stored_uris[entry[0]] = None
+        while len(stored_uris) > STORED_URIS_SIZE:
+            stored_uris.popitem(last=False)
+        self._stored_uris = stored_uris
+
+    def _drop_from_timeline(self, predicate: Callable[[str], bool]) -> None:
+        if any(predicate(entry[0]) for entry in self._timeline):
+            kept = [(entry, key) for entry, key in zip(self._timeline, self._timeline_keys)
+                    if not predicate(entry[0])]
+            self._timeline = [entry for entry, _ in kept]
+            self._timeline_keys = [key for _, key in kept]
+
+    def _add_post(self, entry: TimelineEntry) -> None:
+        if entry[0] in self._stored_uris:
+            return
+        self._stored_uris[entry[0]] = None
+        if len(self._stored_uris) > STORED_URIS_SIZE:
+            self._stored_uris.popitem(last=False)
+        key = _key(entry[2])
+        index = bisect.bisect_right(self._timeline_keys, key)
+        if index >= TIMELINE_SIZE:
+            return
+        self._timeline.insert(index, entry)
+        self._timeline_keys.insert(index, key)
+        if len(self._timeline) > TIMELINE_SIZE:
+            del self._timeline[TIMELINE_SIZE:]
+            del self._timeline_keys[TIMELINE_SIZE:]
+
+
+def _entry(post: Post) -> TimelineEntry:
+    # Remote timestamps come back without microseconds; drop them locally too so that
+    # cursors issued from memory and from Supabase order posts the same way
+    return post.uri, post.cid, post.indexed_at.replace(microsecond=0)
+
+
+def _author(uri: str) -> str:
+    # at://<did>/<collection>/<rkey>
+    return uri[len('at://'):].split('/', 1)[0]
+
+
+def _key(indexed_at: datetime) -> float:
+    # Negated so that the newest-first timeline is ascending for bisect
+    if indexed_at.tzinfo is not None:
+        indexed_at = indexed_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return -(indexed_at - _EPOCH).total_seconds()
+
+
+_state: Optional[ServingState] = None
+_state_lock = threading.Lock()
+
+
+def get_serving_state() -> ServingState:
+    """Return the serving state, loading the snapshot or rebuilding it on first use"""
+    global _state
+    if _state is not None:
+        return _state
+
+    with _state_lock:
+        if _state is not None:
+            return _state
+
+        snapshot = Snapshot.load(config.SNAPSHOT_PATH)
+        if snapshot is None:
+            _state = ServingState.rebuild()
+            return _state
+
+        logger.info(f"Loaded snapshot from {config.SNAPSHOT_PATH} (seq={snapshot.seq}, "
+                    f"written at {snapshot.written_at.isoformat()})")
+        _state = ServingState(snapshot)
+        threading.Thread(target=_reconcile, args=(_state,), daemon=True).start()
+        return _state
+
+
+def _reconcile(state: ServingState) -> None:
+    # The firehose waits for this, so keep trying rather than leave the state stale
+    delay = 1
+    while True:
+        try:
+            state.reconcile()
+            return
+        except Exception as e:
+            logger.error(f"Error reconciling serving state: {str(e)}. Retrying in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, RECONCILE_MAX_DELAY)
+
+
+def save_snapshot() -> None:
+    """Write the current serving state to disk, if it has been loaded"""
+    if _state is None:
+        return
+    try:
+        _state.to_snapshot().save(config.SNAPSHOT_PATH)
+    except Exception as e:
+        logger.error(f"Error writing snapshot to {config.SNAPSHOT_PATH}: {str(e)}")
+
+
+def run_snapshots(stop_event: threading.Event) -> None:
+    """Periodically snapshot the serving state until stop_event is set"""
+    while not stop_event.wait(config.SNAPSHOT_INTERVAL):
+        save_snapshot()
@@ -25,4 +25,6 @@ create table if not exists users (
 
 -- Create indexes
 create index if not exists users_added_at_idx on users(added_at desc);
-create index if not exists users_active_idx on users(active);
\ No newline at end of file
+create index if not exists users_active_idx on users(active);
+-- Keyset pagination over active users (GET /api/users)
+create index if not exists users_active_did_idx on users(did) where active;